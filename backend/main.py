@@ -1,3 +1,5 @@
+import contextlib
+import hashlib
 import logging
 import uuid
 from datetime import datetime, timezone
@@ -14,9 +16,30 @@ app = FastAPI(
 )
 
 MAX_PDF_SIZE_BYTES = 5 * 1024 * 1024  # 5MB
+UPLOAD_CHUNK_SIZE_BYTES = 64 * 1024  # 64KB
+UPLOAD_FLUSH_CHUNKS = 16  # ~1MB of queued APPENDs per round trip
 STREAM_INGESTED = "pdf:ingested"
-BIN_KEY_TEMPLATE = "pdf:bin:{file_id}"
-META_KEY_TEMPLATE = "pdf:meta:{file_id}"
+
+
+def _bin_key(file_id: str) -> str:
+    return f"pdf:bin:{file_id}"
+
+
+def _meta_key(file_id: str) -> str:
+    return f"pdf:meta:{file_id}"
+
+
+def _text_key(file_id: str) -> str:
+    return f"pdf:text:{file_id}"
+
+
+def _summary_key(file_id: str) -> str:
+    return f"pdf:summary:{file_id}"
+
+
+def _digest_key(extraction_mode: str, digest: str) -> str:
+    return f"pdf:digest:{extraction_mode}:{digest}"
+
 
 # Configure CORS
 app.add_middleware(
@@ -27,41 +50,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
 
 
-def _decode_hash(raw: dict | None) -> dict:
-    if not raw:
-        return {}
-    decoded = {}
-    for key, value in raw.items():
-        k = key.decode() if isinstance(key, (bytes, bytearray)) else key
-        v = value.decode() if isinstance(value, (bytes, bytearray)) else value
-        decoded[k] = v
-    return decoded
+def _queue_file_reads(pipe, file_id: str) -> None:
+    """Queue reads of a file's meta hash and its text/summary strings on ``pipe``."""
+    pipe.hgetall(_meta_key(file_id))
+    pipe.mget(
+        _text_key(file_id),
+        _summary_key(file_id),
+    )
+
+
+def _file_response(meta: dict, text: str | None, summary: str | None, file_id: str = "") -> dict:
+    # Hashes written before text/summary moved to their own keys still carry them inline
+    return {
+        "file_id": meta.get("file_id", file_id),
+        "filename": meta.get("filename", ""),
+        "status": meta.get("status", "unknown"),
+        "text": text if text is not None else meta.get("text", ""),
+        "summary": summary if summary is not None else meta.get("summary", ""),
+        "updated_at": meta.get("updated_at"),
+    }
 
 
 @app.get("/summaries")
 async def get_all_summaries():
     """Get all summaries from Redis"""
     redis_client = get_redis_client()
-    pattern = META_KEY_TEMPLATE.format(file_id="*")
+    pattern = _meta_key("*")
     
+    keys = [key async for key in redis_client.scan_iter(match=pattern, count=500)]
+    pipe = redis_client.pipeline(transaction=False)
+    for key in keys:
+        _queue_file_reads(pipe, key.rsplit(":", 1)[-1])
+    results = await pipe.execute()
+
     summaries = []
-    for key in redis_client.scan_iter(match=pattern):
-        meta = redis_client.hgetall(key)
+    for meta, (text, summary) in zip(results[::2], results[1::2]):
         if meta:
-            decoded = _decode_hash(meta)
-            summaries.append({
-                "file_id": decoded.get("file_id", ""),
-                "filename": decoded.get("filename", ""),
-                "status": decoded.get("status", "unknown"),
-                "text": decoded.get("text", ""),
-                "summary": decoded.get("summary", ""),
-                "updated_at": decoded.get("updated_at"),
-            })
+            summaries.append(_file_response(meta, text, summary))
     
     return {"summaries": summaries, "count": len(summaries)}
 
@@ -69,8 +100,9 @@ async def get_all_summaries():
 @app.get("/status/{file_id}")
 async def get_file_status(file_id: str):
     redis_client = get_redis_client()
-    meta_key = META_KEY_TEMPLATE.format(file_id=file_id)
-    meta = redis_client.hgetall(meta_key)
+    pipe = redis_client.pipeline(transaction=False)
+    _queue_file_reads(pipe, file_id)
+    meta, (text, summary) = await pipe.execute()
 
     if not meta:
         raise HTTPException(
@@ -78,15 +110,49 @@ async def get_file_status(file_id: str):
             detail="File not found.",
         )
 
-    decoded = _decode_hash(meta)
-    return {
-        "file_id": decoded.get("file_id", file_id),
-        "filename": decoded.get("filename", ""),
-        "status": decoded.get("status", "unknown"),
-        "text": decoded.get("text", ""),
-        "summary": decoded.get("summary", ""),
-        "updated_at": decoded.get("updated_at"),
-    }
+    return _file_response(meta, text, summary, file_id)
+
+
+async def _stream_upload_to_redis(file: UploadFile, bin_key: str, redis_client) -> tuple[int, str]:
+    """
+    Append the upload to ``bin_key`` chunk by chunk so the whole PDF is never held in memory.
+    APPENDs are pipelined and flushed every UPLOAD_FLUSH_CHUNKS chunks.
+    Stops reading (and drops the partial binary) as soon as the size limit is exceeded.
+    Returns the number of bytes read and the SHA-256 hex digest of the content.
+    """
+    file_size = 0
+    digest = hashlib.sha256()
+    pipe = redis_client.pipeline(transaction=False)
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE_BYTES):
+            file_size += len(chunk)
+            if file_size > MAX_PDF_SIZE_BYTES:
+                pipe.delete(bin_key)
+                break
+            digest.update(chunk)
+            pipe.append(bin_key, chunk)
+            if len(pipe) >= UPLOAD_FLUSH_CHUNKS:
+                await pipe.execute()
+        await pipe.execute()
+    except Exception:
+        # Don't leave a partial binary behind that nothing points to
+        with contextlib.suppress(Exception):
+            await redis_client.delete(bin_key)
+        raise
+    return file_size, digest.hexdigest()
+
+
+async def _get_cached_meta(redis_client, digest_key: str) -> dict:
+    """Return the meta of an already summarized identical upload, or {} if there is none."""
+    prior_file_id = await redis_client.get(digest_key)
+    if not prior_file_id:
+        return {}
+
+    meta = await redis_client.hgetall(_meta_key(prior_file_id))
+    if meta.get("status") != "summary_ready":
+        return {}
+    return meta
+
 
 @app.post("/summarize")
 async def summarize_pdf(
@@ -99,49 +165,86 @@ async def summarize_pdf(
             detail="Only PDF uploads are supported.",
         )
 
-    file_bytes = await file.read()
-    if not file_bytes:
+    file_id = str(uuid.uuid4())
+    bin_key = _bin_key(file_id)
+    meta_key = _meta_key(file_id)
+
+    redis_client = get_redis_client()
+
+    try:
+        file_size, digest = await _stream_upload_to_redis(file, bin_key, redis_client)
+    except Exception as exc:  # pragma: no cover - defensive for Redis issues
+        logging.error(f"Failed to store uploaded PDF: {exc}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Unable to enqueue PDF for processing.",
+        ) from exc
+
+    if not file_size:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Empty file uploads are not allowed.",
         )
 
-    if len(file_bytes) > MAX_PDF_SIZE_BYTES:
+    if file_size > MAX_PDF_SIZE_BYTES:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="File too large. Maximum allowed size is 5MB.",
         )
 
-    file_id = str(uuid.uuid4())
-    bin_key = BIN_KEY_TEMPLATE.format(file_id=file_id)
-    meta_key = META_KEY_TEMPLATE.format(file_id=file_id)
-
-    redis_client = get_redis_client()
+    digest_key = _digest_key(mode, digest)
 
     try:
-        redis_client.set(bin_key, file_bytes)
-        redis_client.hset(
+        cached_meta = await _get_cached_meta(redis_client, digest_key)
+        if cached_meta:
+            # Identical PDF was already summarized in this mode: reuse its text and summary
+            prior_file_id = cached_meta["file_id"]
+            text_key = _text_key(file_id)
+            summary_key = _summary_key(file_id)
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(bin_key)
+            pipe.copy(_text_key(prior_file_id), text_key, replace=True)
+            pipe.copy(_summary_key(prior_file_id), summary_key, replace=True)
+            pipe.hset(
+                meta_key,
+                mapping={
+                    **cached_meta,
+                    "file_id": file_id,
+                    "filename": file.filename or "",
+                    "text_key": text_key,
+                    "summary_key": summary_key,
+                    "updated_at": datetime.now(timezone.utc).isoformat(),
+                },
+            )
+            await pipe.execute()
+            return {
+                "file_id": file_id,
+                "status": "summary_ready",
+            }
+
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(
             meta_key,
             mapping={
                 "file_id": file_id,
                 "filename": file.filename or "",
                 "status": "uploaded",
-                "text": "",
-                "summary": "",
                 "extraction_mode": mode,
                 "updated_at": datetime.now(timezone.utc).isoformat(),
             },
         )
-        redis_client.xadd(
+        pipe.xadd(
             STREAM_INGESTED,
             {
                 "file_id": file_id,
                 "bin_key": bin_key,
                 "meta_key": meta_key,
+                "digest_key": digest_key,
                 "filename": file.filename or "",
                 "extraction_mode": mode,
             },
         )
+        await pipe.execute()
     except Exception as exc:  # pragma: no cover - defensive for Redis issues
         logging.error(f"Failed to enqueue PDF for processing: {exc}")
         raise HTTPException(
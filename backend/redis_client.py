@@ -1,18 +1,27 @@
 import os
 from functools import lru_cache
 
-import redis
+import redis.asyncio as aioredis
 
 
 @lru_cache(maxsize=1)
-def get_redis_client() -> redis.Redis:
+def get_redis_client() -> aioredis.Redis:
     """
-    Returns a cached Redis client configured from environment variables.
+    Returns a cached asyncio Redis client configured from environment variables.
     Defaults are suitable for docker-compose (host 'redis', db 0).
+    Connections are opened lazily, so the client can be created outside the event loop.
     """
     host = os.getenv("REDIS_HOST", "redis")
     port = int(os.getenv("REDIS_PORT", "6379"))
     db = int(os.getenv("REDIS_DB", "0"))
-    # decode_responses is False so we can store binaries without implicit decoding
-    return redis.Redis(host=host, port=port, db=db, decode_responses=False)
-
+    max_connections = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+    # Blocking pool: requests wait for a free connection instead of failing when it's exhausted.
+    # Binaries are only ever written here, so responses can be decoded by the client.
+    pool = aioredis.BlockingConnectionPool(
+        host=host,
+        port=port,
+        db=db,
+        decode_responses=True,
+        max_connections=max_connections,
+    )
+    return aioredis.Redis(connection_pool=pool)
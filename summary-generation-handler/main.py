@@ -2,9 +2,12 @@ import logging
 import os
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from typing import Any, Dict
+from functools import lru_cache, partial
+from typing import Any, Dict, List, Optional, Tuple
 
+import httpx
 from google import genai
 from google.genai import types
 from redis_client import get_redis_client
@@ -17,16 +20,63 @@ logging.basicConfig(
 
 STREAM_TEXT_READY = "pdf:text_ready"
 STREAM_SUMMARY_READY = "pdf:summary_ready"
-META_KEY_TEMPLATE = "pdf:meta:{file_id}"
 CONSUMER_GROUP = "summary_handlers"
+CLAIM_MIN_IDLE_MS = 60000
+MAX_DELIVERIES = 3  # entries delivered more often than this are acked and left in error
+GEMINI_MAX_CONCURRENCY = 8
+GEMINI_MAX_CONNECTIONS = 64
+GEMINI_MAX_KEEPALIVE_CONNECTIONS = 32
+DIGEST_TTL_SECONDS = 7 * 24 * 60 * 60  # 7 days
+SUMMARY_MODEL = "gemini-2.5-flash-lite"
+# Longer texts are cut to their first 80% / last 20% of this budget before summarizing
+SUMMARY_MAX_CHARS = int(os.getenv("SUMMARY_MAX_CHARS", "100000"))
+if SUMMARY_MAX_CHARS < 1:
+    raise ValueError(f"SUMMARY_MAX_CHARS must be at least 1, got {SUMMARY_MAX_CHARS}")
+
+SUMMARY_PROMPT = (
+    "Summarize the provided document text in 3-5 concise sentences. "
+    "Focus on the main ideas, key facts, and outcomes. "
+    "Do not include metadata, instructions, or apologies."
+)
+SUMMARY_PROMPTS = {
+    "plain_text": SUMMARY_PROMPT,
+    "markdown": SUMMARY_PROMPT + (
+        " The input text format is Markdown. "
+        "Please return your summary also formatted as Markdown."
+    ),
+}
+
+
+def _meta_key(file_id: str) -> str:
+    return f"pdf:meta:{file_id}"
+
+
+def _text_key(file_id: str) -> str:
+    return f"pdf:text:{file_id}"
+
+
+def _summary_key(file_id: str) -> str:
+    return f"pdf:summary:{file_id}"
+
 
 def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _update_meta(meta_key: str, mapping: Dict[str, Any]) -> None:
-    client = get_redis_client()
-    mapping["updated_at"] = _now_iso()
+def _update_meta(
+    meta_key: str,
+    mapping: Dict[str, Any],
+    pipe=None,
+    now_iso: Optional[str] = None,
+) -> None:
+    """
+    Set ``mapping`` plus a fresh updated_at on the meta hash.
+    When ``pipe`` is given the HSET is only queued, so it rides along with the caller's other writes.
+    """
+    if not mapping:
+        return
+    mapping["updated_at"] = now_iso or _now_iso()
+    client = pipe if pipe is not None else get_redis_client()
     client.hset(meta_key, mapping=mapping)
 
 
@@ -57,31 +107,53 @@ def _ensure_consumer_group(client) -> None:
             logging.warning("Unexpected error creating consumer group: %s", exc)
 
 
+@lru_cache(maxsize=1)
+def _gemini_client() -> genai.Client:
+    """
+    Returns a cached Gemini client so credentials and HTTP connections are reused.
+    HTTP/2 lets the concurrent summary threads multiplex over one connection.
+    """
+    return genai.Client(
+        http_options=types.HttpOptions(
+            client_args={
+                "http2": True,
+                "limits": httpx.Limits(
+                    max_connections=GEMINI_MAX_CONNECTIONS,
+                    max_keepalive_connections=GEMINI_MAX_KEEPALIVE_CONNECTIONS,
+                ),
+            },
+        ),
+    )
+
+
+def _truncate_for_summary(text: str) -> str:
+    """
+    Cap the text sent to Gemini at SUMMARY_MAX_CHARS, keeping the beginning and the end
+    of the document (intro and conclusion) and dropping the middle.
+    """
+    if len(text) <= SUMMARY_MAX_CHARS:
+        return text
+
+    head_chars = SUMMARY_MAX_CHARS * 4 // 5
+    tail_chars = SUMMARY_MAX_CHARS - head_chars
+    return f"{text[:head_chars]}\n\n...\n\n{text[-tail_chars:]}"
+
+
 def summarize_text(text: str, extraction_mode: str) -> str:
     text = text.strip()
     if not text:
         return ""
 
-    gemini_client = genai.Client()
+    text = _truncate_for_summary(text)
 
-    prompt = (
-        "Summarize the provided document text in 3-5 concise sentences. "
-        "Focus on the main ideas, key facts, and outcomes. "
-        "Do not include metadata, instructions, or apologies."
-    )
-    
-    if extraction_mode == "markdown":
-        prompt += (
-            "The input text format is Markdown. "
-            "Please return your summary also formatted as Markdown."
-        )
-
-    text = types.Part.from_text(text=f"{prompt}\n\n{text}")
+    gemini_client = _gemini_client()
 
+    mode = "markdown" if extraction_mode == "markdown" else "plain_text"
     response = gemini_client.models.generate_content(
-        model='gemini-2.5-flash-lite',
-        contents=types.Part.from_text(text=f"{prompt}\n\n{text}"),
+        model=SUMMARY_MODEL,
+        contents=[types.Part.from_text(text=text)],
         config=types.GenerateContentConfig(
+            system_instruction=SUMMARY_PROMPTS[mode],
             temperature=0,
             top_p=0.95,
             top_k=20,
@@ -94,14 +166,14 @@ def summarize_text(text: str, extraction_mode: str) -> str:
     return response.text.strip()
 
 
-def _process_message(fields: Dict[Any, Any], client) -> bool:
+def _process_message(fields: Dict[Any, Any], client, now_iso: Optional[str] = None) -> bool:
     """
     Process a single message from the stream.
     Returns True if processing was successful and message should be acknowledged.
     """
     
     file_id = fields.get("file_id")
-    meta_key = fields.get("meta_key") or META_KEY_TEMPLATE.format(file_id=file_id)
+    meta_key = fields.get("meta_key") or _meta_key(file_id)
     extraction_mode = fields.get("extraction_mode")
 
     logging.info("Generating summary for the file: %s", file_id)
@@ -110,13 +182,22 @@ def _process_message(fields: Dict[Any, Any], client) -> bool:
         logging.warning("Received text_ready event without file_id")
         return True
 
-    text = client.hget(meta_key, "text") or ""
-    
+    text = fields.get("text")
+    if text is None:
+        # Text was too large to travel in the event
+        text_key = fields.get("text_key") or _text_key(file_id)
+        text = client.get(text_key)
+        if text is None:
+            # Events queued before text moved to its own key point at the meta hash instead
+            text = client.hget(meta_key, "text")
+        text = text or ""
+
     if not text.strip():
         logging.error("No text available for summary for file_id=%s", file_id)
         _update_meta(
             meta_key,
             {"status": "error", "error": "missing_text_for_summary"},
+            now_iso=now_iso,
         )
         return True
 
@@ -127,52 +208,130 @@ def _process_message(fields: Dict[Any, Any], client) -> bool:
         _update_meta(
             meta_key,
             {"status": "error", "error": "summary_failed"},
+            now_iso=now_iso,
         )
         
         return False
 
+    summary_key = _summary_key(file_id)
+    pipe = client.pipeline(transaction=False)
+    pipe.set(summary_key, summary)
     _update_meta(
         meta_key,
-        {"status": "summary_ready", "summary": summary},
+        {"status": "summary_ready", "summary_key": summary_key},
+        pipe=pipe,
+        now_iso=now_iso,
     )
-
-    client.xadd(
+    digest_key = fields.get("digest_key")
+    if digest_key:
+        # Let later uploads of the same PDF reuse this summary
+        pipe.set(digest_key, file_id, ex=DIGEST_TTL_SECONDS)
+    pipe.xadd(
         STREAM_SUMMARY_READY,
         {
             "file_id": file_id,
             "meta_key": meta_key,
         },
     )
-    
+    pipe.execute()
+
     return True
 
+
+def _read_batch(client, consumer_name: str) -> List[Tuple[str, Dict[str, str], int]]:
+    """
+    Read the next batch with XREADGROUP ... CLAIM (Redis 8.4+), which hands back entries
+    left pending for longer than CLAIM_MIN_IDLE_MS alongside new ones, in one round trip.
+    Returns (message_id, fields, delivery_count) for each entry.
+    """
+    reply = client.execute_command(
+        "XREADGROUP",
+        "GROUP", CONSUMER_GROUP, consumer_name,
+        "CLAIM", CLAIM_MIN_IDLE_MS,
+        "COUNT", 100,
+        "BLOCK", 5000,
+        "STREAMS", STREAM_TEXT_READY, ">",
+    )
+
+    batch = []
+    for _, entries in reply or []:
+        for entry in entries:
+            # Claimed entries carry [id, fields, idle_ms, delivery_count]; deleted ones have no fields
+            message_id, raw_fields = entry[0], entry[1] or []
+            delivery_count = int(entry[3]) if len(entry) > 3 else 1
+            fields = dict(zip(raw_fields[::2], raw_fields[1::2]))
+            batch.append((message_id, fields, delivery_count))
+    return batch
+
+
+def _abandon_message(
+    message_id: str,
+    fields: Dict[str, str],
+    delivery_count: int,
+    now_iso: Optional[str] = None,
+) -> None:
+    """Stop retrying an entry that keeps failing: leave its meta in error so it can be acked."""
+    logging.error("Giving up on message %s after %d deliveries", message_id, delivery_count)
+    file_id = fields.get("file_id")
+    if not file_id:
+        return
+
+    meta_key = fields.get("meta_key") or _meta_key(file_id)
+    pipe = get_redis_client().pipeline(transaction=False)
+    # Keep the reason recorded by the last failed attempt, if any
+    pipe.hsetnx(meta_key, "error", "max_deliveries_exceeded")
+    _update_meta(meta_key, {"status": "error"}, pipe=pipe, now_iso=now_iso)
+    pipe.execute()
+
+
+def _process_entry(
+    entry: Tuple[str, Dict[str, str], int],
+    client,
+    now_iso: Optional[str] = None,
+) -> bool:
+    """Run _process_message for one stream entry on a pool thread, never raising."""
+    message_id, fields, delivery_count = entry
+    try:
+        if delivery_count > MAX_DELIVERIES:
+            _abandon_message(message_id, fields, delivery_count, now_iso=now_iso)
+            return True
+        return _process_message(fields, client, now_iso=now_iso)
+    except Exception as exc:
+        logging.exception("Failed to process message %s: %s", message_id, exc)
+        return False
+
+
 def consume_text_ready_stream() -> None:
     client = get_redis_client()
     consumer_name = _get_consumer_name()
+    executor = ThreadPoolExecutor(max_workers=GEMINI_MAX_CONCURRENCY)
     
     _ensure_consumer_group(client)
+    # _read_batch parses XREADGROUP itself: the stock parser drops the CLAIM delivery counts
+    client.set_response_callback("XREADGROUP", lambda response, **options: response)
     
     logging.info("Starting consumer '%s' in group '%s'", consumer_name, CONSUMER_GROUP)
     
     while True:
         try:
-            entries = client.xreadgroup(
-                groupname=CONSUMER_GROUP,
-                consumername=consumer_name,
-                streams={STREAM_TEXT_READY: ">"},
-                count=100,
-                block=5000
-            )
-            
-            if not entries:
+            batch = _read_batch(client, consumer_name)
+            if not batch:
                 continue
 
-            for _, messages in entries:
-                for message_id, raw_fields in messages:
-                    success = _process_message(raw_fields, client)
-                    if success:
-                        logging.info("Acknowledged message: %s", message_id)
-                        client.xack(STREAM_TEXT_READY, CONSUMER_GROUP, message_id)
+            batch_now = _now_iso()
+            # Gemini calls are network-bound, so summarize the batch concurrently
+            results = executor.map(
+                partial(_process_entry, client=client, now_iso=batch_now),
+                batch,
+            )
+            acked_ids = [
+                message_id
+                for (message_id, _, _), success in zip(batch, results)
+                if success
+            ]
+            if acked_ids:
+                client.xack(STREAM_TEXT_READY, CONSUMER_GROUP, *acked_ids)
+                logging.info("Acknowledged %d message(s)", len(acked_ids))
                     
         except Exception as exc:
             logging.exception("Error consuming text_ready stream: %s", exc)
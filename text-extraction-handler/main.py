@@ -3,14 +3,18 @@ import logging
 import os
 import sys
 import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timezone
-from typing import Any, Dict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 from google import genai
 from google.genai import types
 
+import pypdfium2 as pdfium
 from pypdf import PdfReader
 
-from redis_client import get_redis_client
+from redis_client import get_binary_redis_client, get_redis_client
 
 logging.basicConfig(
     level=logging.INFO,
@@ -20,27 +24,55 @@ logging.basicConfig(
 
 STREAM_INGESTED = "pdf:ingested"
 STREAM_TEXT_READY = "pdf:text_ready"
-BIN_KEY_TEMPLATE = "pdf:bin:{file_id}"
-META_KEY_TEMPLATE = "pdf:meta:{file_id}"
 CONSUMER_GROUP = "text_extraction_handlers"
+CLAIM_MIN_IDLE_MS = 60000
+MAX_DELIVERIES = 3  # entries delivered more often than this are acked and left in error
+# "pdfium" (default, PDFium C++ bindings) or "pypdf" (pure-Python fallback)
+PDF_TEXT_EXTRACTOR = os.getenv("PDF_TEXT_EXTRACTOR", "pdfium")
+PARALLEL_EXTRACTION_MIN_PAGES = 3
+TEXT_LAYER_CHECK_PAGES = 3
+INLINE_TEXT_MAX_CHARS = 4 * 1024  # the stream is never trimmed; larger texts only live under the text key
+PAGE_POOL_MAX_WORKERS = 4  # each worker gets its own copy of the PDF bytes
+# sched_getaffinity respects CPU pinning but only exists on Linux
+PAGE_POOL_WORKERS = min(
+    len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1),
+    PAGE_POOL_MAX_WORKERS,
+)
 
-def _now_iso() -> str:
-    return datetime.now(timezone.utc).isoformat()
+# Process pool for per-page pdfium extraction, created on first use
+_page_pool: Optional[ProcessPoolExecutor] = None
 
 
-def _decode_field(value: Any) -> str:
-    if isinstance(value, (bytes, bytearray)):
-        return value.decode()
-    return str(value)
+def _bin_key(file_id: str) -> str:
+    return f"pdf:bin:{file_id}"
 
 
-def _decode_stream_fields(fields: Dict[Any, Any]) -> Dict[str, str]:
-    return {_decode_field(k): _decode_field(v) for k, v in fields.items()}
+def _meta_key(file_id: str) -> str:
+    return f"pdf:meta:{file_id}"
 
 
-def _update_meta(meta_key: str, mapping: Dict[str, Any]) -> None:
-    client = get_redis_client()
-    mapping["updated_at"] = _now_iso()
+def _text_key(file_id: str) -> str:
+    return f"pdf:text:{file_id}"
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _update_meta(
+    meta_key: str,
+    mapping: Dict[str, Any],
+    pipe=None,
+    now_iso: Optional[str] = None,
+) -> None:
+    """
+    Set ``mapping`` plus a fresh updated_at on the meta hash.
+    When ``pipe`` is given the HSET is only queued, so it rides along with the caller's other writes.
+    """
+    if not mapping:
+        return
+    mapping["updated_at"] = now_iso or _now_iso()
+    client = pipe if pipe is not None else get_redis_client()
     client.hset(meta_key, mapping=mapping)
 
 
@@ -71,8 +103,14 @@ def _ensure_consumer_group(client) -> None:
             logging.warning("Unexpected error creating consumer group: %s", exc)
 
 
+@lru_cache(maxsize=1)
+def _gemini_client() -> genai.Client:
+    """Returns a cached Gemini client so credentials and HTTP connections are reused."""
+    return genai.Client()
+
+
 def extract_markdown_from_pdf(pdf_bytes: bytes) -> str:
-    client = genai.Client()
+    client = _gemini_client()
 
     prompt = "Extract the text from the PDF in markdown format"
     response = client.models.generate_content(
@@ -89,20 +127,97 @@ def extract_markdown_from_pdf(pdf_bytes: bytes) -> str:
     return response.text
 
 
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+def _extract_text_with_pypdf(pdf_bytes: bytes) -> str:
     reader = PdfReader(io.BytesIO(pdf_bytes))
     return "\n".join(page.extract_text() or "" for page in reader.pages)
 
 
-def _process_message(fields: Dict[Any, Any], client) -> bool:
+def _extract_page_range(pdf, start: int, stop: int) -> str:
+    texts = []
+    for index in range(start, stop):
+        page = pdf[index]
+        textpage = page.get_textpage()
+        texts.append(textpage.get_text_bounded())
+        # Release native handles eagerly instead of waiting for GC
+        textpage.close()
+        page.close()
+    return "\n".join(texts)
+
+
+def extract_pages(args: Tuple[bytes, int, int]) -> str:
+    """
+    Extract the text of pages [start, stop) in a pool worker process.
+    Reopens the PDF from bytes since PDFium handles can't be shared across processes.
+    """
+    pdf_bytes, start, stop = args
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        return _extract_page_range(pdf, start, stop)
+    finally:
+        pdf.close()
+
+
+def _get_page_pool() -> ProcessPoolExecutor:
+    global _page_pool
+    if _page_pool is None:
+        _page_pool = ProcessPoolExecutor(max_workers=PAGE_POOL_WORKERS)
+    return _page_pool
+
+
+def _reset_page_pool() -> None:
+    """Drop a broken pool so the next extraction starts a fresh one."""
+    global _page_pool
+    if _page_pool is not None:
+        _page_pool.shutdown(wait=False, cancel_futures=True)
+        _page_pool = None
+
+
+def _extract_text_with_pdfium(pdf_bytes: bytes) -> str:
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        page_count = len(pdf)
+        # Small documents aren't worth the cost of shipping bytes to other processes
+        if page_count < PARALLEL_EXTRACTION_MIN_PAGES or PAGE_POOL_WORKERS < 2:
+            return _extract_page_range(pdf, 0, page_count)
+    finally:
+        pdf.close()
+
+    # Split pages into one contiguous range per worker so each process parses the PDF once
+    workers = min(page_count, PAGE_POOL_WORKERS)
+    bounds = [page_count * i // workers for i in range(workers + 1)]
+    ranges = [(pdf_bytes, bounds[i], bounds[i + 1]) for i in range(workers)]
+    try:
+        return "\n".join(_get_page_pool().map(extract_pages, ranges))
+    except BrokenProcessPool:
+        # A worker died (e.g. PDFium crashed on a malformed PDF): fail only this message
+        _reset_page_pool()
+        raise
+
+
+def has_text_layer(pdf_bytes: bytes) -> bool:
+    """Cheap check whether any of the first TEXT_LAYER_CHECK_PAGES pages has extractable text."""
+    pdf = pdfium.PdfDocument(pdf_bytes)
+    try:
+        page_count = min(len(pdf), TEXT_LAYER_CHECK_PAGES)
+        return bool(_extract_page_range(pdf, 0, page_count).strip())
+    finally:
+        pdf.close()
+
+
+def extract_text_from_pdf(pdf_bytes: bytes) -> str:
+    if PDF_TEXT_EXTRACTOR == "pypdf":
+        return _extract_text_with_pypdf(pdf_bytes)
+    return _extract_text_with_pdfium(pdf_bytes)
+
+
+def _process_message(fields: Dict[Any, Any], client, now_iso: Optional[str] = None) -> bool:
     """
     Process a single message from the stream.
     Returns True if processing was successful and message should be acknowledged.
     """
-    fields = _decode_stream_fields(fields)
     file_id = fields.get("file_id")
-    bin_key = fields.get("bin_key") or BIN_KEY_TEMPLATE.format(file_id=file_id)
-    meta_key = fields.get("meta_key") or META_KEY_TEMPLATE.format(file_id=file_id)
+    bin_key = fields.get("bin_key") or _bin_key(file_id)
+    meta_key = fields.get("meta_key") or _meta_key(file_id)
     extraction_mode = fields.get("extraction_mode")
 
     logging.info("Extracting text from the file: %s in mode: %s", file_id, extraction_mode)
@@ -111,17 +226,27 @@ def _process_message(fields: Dict[Any, Any], client) -> bool:
         logging.warning("Received ingested event without file_id")
         return True
 
-    pdf_bytes = client.get(bin_key)
+    pdf_bytes = get_binary_redis_client().get(bin_key)
     if not pdf_bytes:
         logging.error("PDF binary not found for file_id=%s", file_id)
         _update_meta(
             meta_key,
             {"status": "error", "error": "binary_missing"},
+            now_iso=now_iso,
         )
         return True
 
     try:
         if extraction_mode == "markdown":
+            if not has_text_layer(pdf_bytes):
+                # Don't spend a Gemini call on a PDF with nothing to extract
+                logging.warning("PDF has no text layer, skipping extraction for file_id=%s", file_id)
+                _update_meta(
+                    meta_key,
+                    {"status": "error", "error": "scanned_pdf_unsupported"},
+                    now_iso=now_iso,
+                )
+                return True
             extracted_text = extract_markdown_from_pdf(pdf_bytes)
         else:
             extracted_text = extract_text_from_pdf(pdf_bytes)
@@ -130,53 +255,113 @@ def _process_message(fields: Dict[Any, Any], client) -> bool:
         _update_meta(
             meta_key,
             {"status": "error", "error": "text_extraction_failed"},
+            now_iso=now_iso,
         )
         return False
 
+    text_key = _text_key(file_id)
+    event = {
+        "file_id": file_id,
+        "meta_key": meta_key,
+        "text_key": text_key,
+        "digest_key": fields.get("digest_key", ""),
+        "extraction_mode": extraction_mode,
+        "text_len": len(extracted_text),
+    }
+    # Inline small texts so the summary worker doesn't have to read them back from Redis
+    if len(extracted_text) <= INLINE_TEXT_MAX_CHARS:
+        event["text"] = extracted_text
+
+    pipe = client.pipeline(transaction=False)
+    pipe.set(text_key, extracted_text)
     _update_meta(
         meta_key,
-        {"status": "text_ready", "text": extracted_text},
+        {"status": "text_ready", "text_key": text_key},
+        pipe=pipe,
+        now_iso=now_iso,
     )
+    pipe.xadd(STREAM_TEXT_READY, event)
+    pipe.execute()
 
-    client.xadd(
-        STREAM_TEXT_READY,
-        {
-            "file_id": file_id,
-            "meta_key": meta_key,
-            "extraction_mode": extraction_mode,
-        },
-    )
-    
     return True
 
 
+def _read_batch(client, consumer_name: str) -> List[Tuple[str, Dict[str, str], int]]:
+    """
+    Read the next batch with XREADGROUP ... CLAIM (Redis 8.4+), which hands back entries
+    left pending for longer than CLAIM_MIN_IDLE_MS alongside new ones, in one round trip.
+    Returns (message_id, fields, delivery_count) for each entry.
+    """
+    reply = client.execute_command(
+        "XREADGROUP",
+        "GROUP", CONSUMER_GROUP, consumer_name,
+        "CLAIM", CLAIM_MIN_IDLE_MS,
+        "COUNT", 100,
+        "BLOCK", 5000,
+        "STREAMS", STREAM_INGESTED, ">",
+    )
+
+    batch = []
+    for _, entries in reply or []:
+        for entry in entries:
+            # Claimed entries carry [id, fields, idle_ms, delivery_count]; deleted ones have no fields
+            message_id, raw_fields = entry[0], entry[1] or []
+            delivery_count = int(entry[3]) if len(entry) > 3 else 1
+            fields = dict(zip(raw_fields[::2], raw_fields[1::2]))
+            batch.append((message_id, fields, delivery_count))
+    return batch
+
+
+def _abandon_message(
+    message_id: str,
+    fields: Dict[str, str],
+    delivery_count: int,
+    now_iso: Optional[str] = None,
+) -> None:
+    """Stop retrying an entry that keeps failing: leave its meta in error so it can be acked."""
+    logging.error("Giving up on message %s after %d deliveries", message_id, delivery_count)
+    file_id = fields.get("file_id")
+    if not file_id:
+        return
+
+    meta_key = fields.get("meta_key") or _meta_key(file_id)
+    pipe = get_redis_client().pipeline(transaction=False)
+    # Keep the reason recorded by the last failed attempt, if any
+    pipe.hsetnx(meta_key, "error", "max_deliveries_exceeded")
+    _update_meta(meta_key, {"status": "error"}, pipe=pipe, now_iso=now_iso)
+    pipe.execute()
+
+
 def consume_ingested_stream() -> None:
     client = get_redis_client()
     consumer_name = _get_consumer_name()
     
     _ensure_consumer_group(client)
+    # _read_batch parses XREADGROUP itself: the stock parser drops the CLAIM delivery counts
+    client.set_response_callback("XREADGROUP", lambda response, **options: response)
     
     logging.info("Starting consumer '%s' in group '%s'", consumer_name, CONSUMER_GROUP)
     
     while True:
         try:
-            entries = client.xreadgroup(
-                groupname=CONSUMER_GROUP,
-                consumername=consumer_name,
-                streams={STREAM_INGESTED: ">"},
-                count=100,
-                block=5000
-            )
-            
-            if not entries:
+            batch = _read_batch(client, consumer_name)
+            if not batch:
                 continue
 
-            for _, messages in entries:
-                for message_id, raw_fields in messages:
-                    success = _process_message(raw_fields, client)
-                    if success:
-                        logging.info("Acknowledged message: %s", message_id)
-                        client.xack(STREAM_INGESTED, CONSUMER_GROUP, message_id)
+            batch_now = _now_iso()
+            acked_ids = []
+            try:
+                for message_id, fields, delivery_count in batch:
+                    if delivery_count > MAX_DELIVERIES:
+                        _abandon_message(message_id, fields, delivery_count, now_iso=batch_now)
+                        acked_ids.append(message_id)
+                    elif _process_message(fields, client, now_iso=batch_now):
+                        acked_ids.append(message_id)
+            finally:
+                # Ack whatever succeeded even if a later message blew up the batch
+                if acked_ids:
+                    client.xack(STREAM_INGESTED, CONSUMER_GROUP, *acked_ids)
+                    logging.info("Acknowledged %d message(s)", len(acked_ids))
                     
         except Exception as exc:  # pragma: no cover - defensive
             logging.exception("Error consuming ingested stream: %s", exc)
@@ -4,15 +4,28 @@ from functools import lru_cache
 import redis
 
 
+def _connection_kwargs() -> dict:
+    return {
+        "host": os.getenv("REDIS_HOST", "redis"),
+        "port": int(os.getenv("REDIS_PORT", "6379")),
+        "db": int(os.getenv("REDIS_DB", "0")),
+    }
+
+
 @lru_cache(maxsize=1)
 def get_redis_client() -> redis.Redis:
     """
     Returns a cached Redis client configured from environment variables.
     Defaults are suitable for docker-compose (host 'redis', db 0).
+    Responses are decoded to str; use get_binary_redis_client for PDF binaries.
     """
-    host = os.getenv("REDIS_HOST", "redis")
-    port = int(os.getenv("REDIS_PORT", "6379"))
-    db = int(os.getenv("REDIS_DB", "0"))
-    # decode_responses=False to store binaries
-    return redis.Redis(host=host, port=port, db=db, decode_responses=False)
+    return redis.Redis(**_connection_kwargs(), decode_responses=True)
+
 
+@lru_cache(maxsize=1)
+def get_binary_redis_client() -> redis.Redis:
+    """
+    Returns a cached Redis client that leaves responses as raw bytes,
+    for reading stored PDF binaries.
+    """
+    return redis.Redis(**_connection_kwargs(), decode_responses=False)